@@ -1,15 +1,17 @@
 import os
+import math
 import uuid
 import cv2
 import numpy as np
 import time
 from flask import Flask, request, jsonify, send_from_directory, render_template
 from flask_cors import CORS
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO, emit, join_room, leave_room
 from ultralytics import YOLO
 import base64
 import threading
 from werkzeug.utils import secure_filename
+from urllib.parse import urlsplit, urlunsplit
 
 app = Flask(__name__)
 CORS(app)
@@ -26,6 +28,41 @@ os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 500 * 1024 * 1024  # 500MB max file size
 
+# Maximum number of real-time video pipelines running at once
+MAX_VIDEO_SESSIONS = int(os.environ.get('MAX_VIDEO_SESSIONS', 4))
+
+# Server-side stream sources (cameras / looping files pulled by the server)
+MAX_STREAM_SOURCES = int(os.environ.get('MAX_STREAM_SOURCES', 32))
+SOURCE_DEFAULT_FPS = 10
+SOURCE_RECONNECT_DELAY = 5  # Seconds before reopening a failed stream
+SOURCE_TRACK_DISTANCE = 120  # Tracker match distance at the source's target fps
+SOURCE_MAX_TRACK_SCALE = 5  # Cap so a long gap doesn't merge unrelated vehicles
+SOURCES_CONFIG = os.environ.get('SOURCES_CONFIG')  # JSON file of sources to register at startup
+SOURCE_FILES_FOLDER = os.environ.get('SOURCE_FILES_FOLDER', UPLOAD_FOLDER)  # Only place local file sources may come from
+ALLOWED_SOURCE_SCHEMES = {'rtsp', 'rtsps', 'http', 'https'}
+# Hosts network sources may be registered for through the API (comma
+# separated). Sources listed in SOURCES_CONFIG are trusted as configured
+SOURCE_ALLOWED_HOSTS = {h.strip().lower() for h in os.environ.get('SOURCE_ALLOWED_HOSTS', '').split(',') if h.strip()}
+
+# Under eventlet, blocking cv2/YOLO calls run on eventlet's OS thread pool,
+# which has only 20 threads by default. Every live source keeps one thread
+# blocked in grab() and every video pipeline one in its capture, so size the
+# pool to hold all of them plus inference and rendering
+if socketio.async_mode == 'eventlet':
+    from eventlet import tpool
+    tpool.set_num_threads(MAX_STREAM_SOURCES + MAX_VIDEO_SESSIONS + 4)
+
+# Run YOLO on every Nth decoded frame and reuse detections in between
+DETECTION_INTERVAL = 3
+
+# Output resolutions viewers can choose from (frame height, None = source)
+OUTPUT_TIERS = {
+    '360p': 360,
+    '720p': 720,
+    'source': None
+}
+DEFAULT_OUTPUT_TIER = 'source'
+
 # Load YOLO model - use fastest model for real-time processing
 print("Loading YOLO model...")
 model = YOLO('yolov8n.pt')  # Using nano model for fastest speed
@@ -139,18 +176,21 @@ class CentroidTracker:
     Tracks vehicles using centroid tracking with improved matching
     Uses distance-based matching and velocity prediction
     """
-    def __init__(self, max_disappeared=5):
+    def __init__(self, max_disappeared=5, max_distance=120):
         self.next_object_id = 0
         self.objects = {}
         self.disappeared = {}
         self.max_disappeared = max_disappeared
+        self.max_distance = max_distance
         self.velocity = {}  # Track velocity for better prediction
         self.counted_ids = set()
         self.vehicle_plates = {}  # Store plate numbers for each tracked vehicle
+        self.object_types = {}  # Vehicle type each object was registered as
     
     def register(self, centroid, vehicle_type):
         self.objects[self.next_object_id] = centroid
         self.disappeared[self.next_object_id] = 0
+        self.object_types[self.next_object_id] = vehicle_type
         # Generate plate number once when vehicle is first registered
         self.vehicle_plates[self.next_object_id] = generate_mock_plate()
         self.next_object_id += 1
@@ -161,6 +201,7 @@ class CentroidTracker:
         del self.disappeared[object_id]
         if object_id in self.vehicle_plates:
             del self.vehicle_plates[object_id]
+        self.object_types.pop(object_id, None)
     
     def update(self, rects, vehicle_types):
         """
@@ -195,9 +236,9 @@ class CentroidTracker:
             used_rows = set()
             used_cols = set()
             
-            # Adaptive distance threshold based on vehicle size
-            # Increased to 120 to handle larger movements between frames
-            max_distance = 120
+            # Distance threshold in pixels (default 120 handles larger
+            # movements between frames; callers may scale it per frame)
+            max_distance = self.max_distance
             
             for row, col in zip(rows, cols):
                 if row in used_rows or col in used_cols:
@@ -235,16 +276,431 @@ class CentroidTracker:
         """Get the plate number for a tracked vehicle"""
         return self.vehicle_plates.get(object_id, "N/A")
 
-def process_video_realtime(video_path, session_id):
+class RegionOfInterest:
+    """
+    Polygon region of a source where vehicles are expected (e.g. the road)
+    Points are normalised (0-1) so one region fits any frame size
+    Inference runs on the polygon's bounding box only, optionally with the
+    pixels outside the polygon blacked out
+    """
+    def __init__(self, points, mask_outside=False):
+        self.points = np.array(points, dtype=np.float32).reshape(-1, 2)
+        if self.points.shape[0] < 3:
+            raise ValueError("Region of interest needs at least 3 points")
+        if not np.isfinite(self.points).all() or self.points.min() < 0 or self.points.max() > 1:
+            raise ValueError("Region of interest points must be normalised to 0-1")
+        self.mask_outside = mask_outside
+        self.frame_shape = None
+    
+    def _prepare(self, frame_shape):
+        """Convert the polygon to pixel coordinates for this frame size"""
+        if self.frame_shape == frame_shape:
+            return
+        
+        frame_height, frame_width = frame_shape
+        polygon = np.round(self.points * [frame_width - 1, frame_height - 1]).astype(np.int32)
+        x, y, w, h = cv2.boundingRect(polygon)
+        
+        self.polygon = polygon
+        self.bounds = (x, y, x + w, y + h)
+        self.mask = None
+        if self.mask_outside:
+            self.mask = np.zeros((h, w), dtype=np.uint8)
+            cv2.fillPoly(self.mask, [(polygon - [x, y]).astype(np.int32)], 255)
+        self.frame_shape = frame_shape
+    
+    def crop(self, frame):
+        """
+        Crop a frame to the region's bounding box
+        Returns: (cropped_frame, (offset_x, offset_y))
+        """
+        self._prepare(frame.shape[:2])
+        x1, y1, x2, y2 = self.bounds
+        cropped = frame[y1:y2, x1:x2]
+        if self.mask is not None:
+            cropped = cv2.bitwise_and(cropped, cropped, mask=self.mask)
+        return cropped, (x1, y1)
+    
+    def scaled_imgsz(self, imgsz, frame_shape):
+        """
+        Shrink imgsz in proportion to the crop so objects keep the same
+        effective resolution as full-frame inference at imgsz
+        """
+        self._prepare(frame_shape[:2])
+        x1, y1, x2, y2 = self.bounds
+        scale = max(x2 - x1, y2 - y1) / max(frame_shape[:2])
+        return max(32, int(np.ceil(imgsz * scale / 32)) * 32)
+    
+    def contains(self, x, y):
+        return cv2.pointPolygonTest(self.polygon, (float(x), float(y)), False) >= 0
+
+def parse_roi(data):
+    """
+    Build a RegionOfInterest from a client payload
+    Accepts a list of [x, y] points or {'points': [...], 'mask': bool}
+    Returns None when no region is given
+    """
+    if not data:
+        return None
+    if isinstance(data, dict):
+        return RegionOfInterest(data.get('points', []), mask_outside=parse_bool(data.get('mask'), False))
+    return RegionOfInterest(data)
+
+def run_blocking(func, *args, **kwargs):
+    """
+    Run a blocking cv2/YOLO call without stalling the server
+    Under the eventlet worker every thread is a green thread, so native
+    calls are handed to eventlet's OS thread pool instead
+    """
+    if socketio.async_mode == 'eventlet':
+        from eventlet import tpool
+        return tpool.execute(func, *args, **kwargs)
+    return func(*args, **kwargs)
+
+# Serialises every call to the shared YOLO model. Ultralytics sets the
+# predictor's conf/imgsz outside its own lock, so concurrent callers would
+# run with each other's settings. Taken in the calling (green) thread before
+# handing off to the thread pool, so the pool never waits on a green lock
+inference_lock = threading.Lock()
+
+def run_inference(frame, conf, imgsz, roi=None):
+    """
+    The single path to the shared model used by videos, cameras and sources
+    Returns: same as detect_vehicles
+    """
+    with inference_lock:
+        return run_blocking(detect_vehicles, frame, conf=conf, imgsz=imgsz, roi=roi)
+
+def detect_vehicles(frame, conf, imgsz, roi=None):
+    """
+    Run YOLO on a frame, or only on its region of interest
+    Boxes are mapped back to full-frame coordinates and detections whose
+    centre falls outside the region are dropped
+    Returns: list of ((x1, y1, x2, y2), vehicle_type, confidence)
+    """
+    offset_x, offset_y = 0, 0
+    source = frame
+    if roi is not None:
+        source, (offset_x, offset_y) = roi.crop(frame)
+        imgsz = roi.scaled_imgsz(imgsz, frame.shape)
+        if source.size == 0:
+            return []
+    
+    results = model(source, conf=conf, imgsz=imgsz, verbose=False)[0]
+    
+    detections = []
+    for box in results.boxes:
+        cls_id = int(box.cls[0])
+        
+        if cls_id in VEHICLE_CLASSES:
+            x1, y1, x2, y2 = box.xyxy[0].cpu().numpy().astype(int)
+            x1, x2 = x1 + offset_x, x2 + offset_x
+            y1, y2 = y1 + offset_y, y2 + offset_y
+            
+            if roi is not None and not roi.contains((x1 + x2) // 2, (y1 + y2) // 2):
+                continue
+            
+            detections.append(((x1, y1, x2, y2), VEHICLE_CLASSES[cls_id], float(box.conf[0])))
+    
+    return detections
+
+def parse_bool(value, default):
+    """Interpret a client flag such as true/false, 1/0 or their string forms"""
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return value != 0
+    if isinstance(value, str):
+        value = value.strip().lower()
+        if value in ('1', 'true', 'yes', 'on'):
+            return True
+        if value in ('0', 'false', 'no', 'off'):
+            return False
+    raise ValueError(f"Expected a boolean, got {value!r}")
+
+def parse_tier(tier):
+    """Validate a client's output tier choice"""
+    if tier is None:
+        return DEFAULT_OUTPUT_TIER
+    if not isinstance(tier, str) or tier not in OUTPUT_TIERS:
+        raise ValueError(f"Unknown output tier '{tier}'. Allowed: {', '.join(OUTPUT_TIERS)}")
+    return tier
+
+class TierRenderer:
+    """
+    Renders annotated JPEG frames for each requested output tier
+    Each tier is resized once from the clean source frame into a reused
+    buffer and overlays are drawn at tier resolution with scaled coordinates
+    """
+    def __init__(self, jpeg_quality=70):
+        self.encode_params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+        self.buffers = {}  # tier -> preallocated resize target
+    
+    def _resize(self, frame, tier, width, height):
+        buffer = self.buffers.get(tier)
+        if buffer is None or buffer.shape[:2] != (height, width):
+            buffer = np.empty((height, width, 3), dtype=frame.dtype)
+            self.buffers[tier] = buffer
+        cv2.resize(frame, (width, height), dst=buffer, interpolation=cv2.INTER_LINEAR)
+        return buffer
+    
+    def render(self, frame, tiers, rects, labels, header):
+        """
+        Draw detections and encode the frame once per tier
+        The source tier is drawn in place on frame, so it is rendered last
+        Returns: {tier: (frame_base64, width, height)}
+        """
+        src_height, src_width = frame.shape[:2]
+        
+        # Tiers at or above the source resolution all share the source frame
+        target_heights = {}
+        for tier in tiers:
+            height = OUTPUT_TIERS[tier]
+            target_heights[tier] = src_height if height is None else min(height, src_height)
+        
+        encoded = {}
+        by_height = {}
+        for tier in sorted(tiers, key=lambda t: target_heights[t]):
+            height = target_heights[tier]
+            if height in by_height:
+                if by_height[height] is not None:
+                    encoded[tier] = by_height[height]
+                continue
+            
+            if height == src_height:
+                canvas, scale = frame, 1.0
+            else:
+                scale = height / src_height
+                width = max(1, int(round(src_width * scale)))
+                canvas = self._resize(frame, tier, width, height)
+            
+            draw_overlays(canvas, rects, labels, header, scale)
+            
+            success, buffer = cv2.imencode('.jpg', canvas, self.encode_params)
+            if success:
+                by_height[height] = (base64.b64encode(buffer).decode('utf-8'),
+                                     canvas.shape[1], canvas.shape[0])
+                encoded[tier] = by_height[height]
+            else:
+                by_height[height] = None
+                print(f"Failed to encode {tier} frame")
+        
+        return encoded
+
+def draw_overlays(canvas, rects, labels, header, scale=1.0):
+    """
+    Draw vehicle boxes and the header text, scaling source-frame
+    coordinates to the canvas resolution
+    """
+    color = (0, 255, 0)
+    thickness = max(1, int(round(2 * scale)))
+    
+    for (x1, y1, x2, y2), label in zip(rects, labels):
+        x1, y1, x2, y2 = (int(v * scale) for v in (x1, y1, x2, y2))
+        cv2.rectangle(canvas, (x1, y1), (x2, y2), color, thickness)
+        cv2.putText(canvas, label, (x1, y1 - max(4, int(10 * scale))),
+                  cv2.FONT_HERSHEY_SIMPLEX, max(0.3, 0.5 * scale), color, thickness)
+    
+    cv2.putText(canvas, header, (10, max(15, int(30 * scale))),
+               cv2.FONT_HERSHEY_SIMPLEX, max(0.4, scale), (0, 255, 255), thickness)
+
+class Broadcast:
+    """
+    Viewers of one processing pipeline
+    Each viewer joins the pipeline's room plus a room for its output tier,
+    so every frame is encoded once per tier and broadcast to all of them
+    """
+    def __init__(self, room, lock):
+        self.room = room
+        self.viewers = {}  # sid -> output tier
+        self.viewers_lock = lock
+    
+    def tier_room(self, tier):
+        return f"{self.room}_{tier}"
+    
+    def add_viewer(self, sid, tier=DEFAULT_OUTPUT_TIER):
+        """Returns True if sid is a new viewer, False if it only changed tier"""
+        if sid in self.viewers:
+            self.set_viewer_tier(sid, tier)
+            return False
+        self.viewers[sid] = tier
+        join_room(self.room, sid=sid)
+        join_room(self.tier_room(tier), sid=sid)
+        return True
+    
+    def set_viewer_tier(self, sid, tier):
+        old_tier = self.viewers.get(sid)
+        if old_tier is None or old_tier == tier:
+            return
+        leave_room(self.tier_room(old_tier), sid=sid)
+        join_room(self.tier_room(tier), sid=sid)
+        self.viewers[sid] = tier
+    
+    def remove_viewer(self, sid):
+        tier = self.viewers.pop(sid, None)
+        if tier is not None:
+            leave_room(self.tier_room(tier), sid=sid)
+            leave_room(self.room, sid=sid)
+    
+    def active_tiers(self):
+        """Output tiers with at least one viewer"""
+        with self.viewers_lock:
+            return set(self.viewers.values())
+
+class VideoSession(Broadcast):
+    """
+    Shared real-time processing pipeline for one video source
+    Every viewer of the same source joins the session's rooms, so each
+    frame is decoded, detected and encoded once and broadcast to all of them
+    """
+    def __init__(self, video_path, realtime_clock=True, roi=None, roi_config=None):
+        super().__init__(f"video_{uuid.uuid4().hex[:8]}", video_sessions_lock)
+        self.video_path = video_path
+        self.filename = os.path.basename(video_path)
+        # Real-time clock mode: drop frames when behind instead of lagging
+        self.realtime_clock = realtime_clock
+        self.roi = roi
+        self.roi_config = roi_config  # Region as sent by the client that started the session
+        self.start_info = None  # Replayed to viewers joining mid-stream
+        self.frame_number = 0
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.resume_event = threading.Event()  # Cleared while paused
+        self.resume_event.set()
+        self.paused_viewers = set()
+    
+    def add_viewer(self, sid, tier=DEFAULT_OUTPUT_TIER):
+        if super().add_viewer(sid, tier):
+            self._update_pipeline_pause()  # A new viewer restarts a paused pipeline
+            if self.start_info is not None:
+                socketio.emit('start', self.start_info, room=sid)
+    
+    def set_viewer_tier(self, sid, tier):
+        if sid in self.paused_viewers:
+            # Paused viewers are outside their tier room; rejoin on resume
+            self.viewers[sid] = tier
+            return
+        super().set_viewer_tier(sid, tier)
+    
+    def remove_viewer(self, sid):
+        """Remove a viewer and cancel the pipeline once nobody is watching"""
+        self.paused_viewers.discard(sid)
+        super().remove_viewer(sid)
+        if not self.viewers:
+            self.stop()
+        else:
+            self._update_pipeline_pause()
+    
+    def active_tiers(self):
+        """Output tiers with at least one viewer that is not paused"""
+        with self.viewers_lock:
+            return {tier for sid, tier in self.viewers.items() if sid not in self.paused_viewers}
+    
+    def stop(self):
+        self.stop_event.set()
+        self.resume_event.set()  # Wake the pipeline if it is paused
+    
+    def pause(self, sid):
+        """
+        Stop sending frames to one viewer; the shared pipeline itself only
+        pauses once every viewer has paused
+        Returns True if the pipeline is paused
+        """
+        if sid in self.viewers and sid not in self.paused_viewers:
+            self.paused_viewers.add(sid)
+            leave_room(self.tier_room(self.viewers[sid]), sid=sid)
+        self._update_pipeline_pause()
+        return self.pipeline_paused
+    
+    def resume(self, sid):
+        """Resume frames for one viewer, restarting the pipeline if needed"""
+        if sid in self.paused_viewers:
+            self.paused_viewers.discard(sid)
+            join_room(self.tier_room(self.viewers[sid]), sid=sid)
+        self._update_pipeline_pause()
+        return self.pipeline_paused
+    
+    def _update_pipeline_pause(self):
+        if self.viewers and self.paused_viewers >= set(self.viewers):
+            self.resume_event.clear()
+        else:
+            self.resume_event.set()
+    
+    @property
+    def pipeline_paused(self):
+        return not self.resume_event.is_set()
+    
+    def stopped_info(self):
+        """Payload of the 'stopped' event"""
+        return {'filename': self.filename, 'frame_number': self.frame_number}
+    
+    @property
+    def stopped(self):
+        return self.stop_event.is_set()
+
+# Active real-time sessions keyed by video path
+video_sessions = {}
+video_sessions_lock = threading.Lock()
+
+def parse_filename(data, required=False):
+    """
+    Get the video filename from a client payload
+    Raises ValueError if the payload or filename is malformed
+    """
+    if data is None:
+        data = {}
+    if not isinstance(data, dict):
+        raise ValueError("Expected a JSON object")
+    
+    filename = data.get('filename')
+    if filename is None:
+        if required:
+            raise ValueError("No video filename given")
+        return None
+    if not isinstance(filename, str) or not filename:
+        raise ValueError("Video filename must be a non-empty string")
+    return filename
+
+def find_viewer_sessions(sid, filename=None):
+    """
+    Get the sessions a client is watching, optionally limited to one video
+    Caller must hold video_sessions_lock
+    """
+    sessions = [s for s in video_sessions.values() if sid in s.viewers]
+    if filename:
+        video_path = os.path.join(UPLOAD_FOLDER, filename)
+        sessions = [s for s in sessions if s.video_path == video_path]
+    return sessions
+
+def grab_frames(cap, count):
+    """
+    Advance a capture by up to count frames without retrieving them
+    Returns: number of frames actually grabbed (fewer at end of video)
+    """
+    grabbed = 0
+    while grabbed < count and cap.grab():
+        grabbed += 1
+    return grabbed
+
+def process_video_realtime(session):
     """
     Process video in real-time with proper centroid tracking
     Detects and counts all vehicles on the road
+    Frames are broadcast to every viewer in the session room
+    In real-time clock mode frames that are already late are skipped with
+    cap.grab(), which still decodes them with the FFmpeg backend but skips
+    the colour conversion, detection, drawing and encoding, so a slow
+    server degrades by frame rate instead of drifting behind the video
     """
+    room = session.room
+    cap = None
     try:
-        cap = cv2.VideoCapture(video_path)
+        cap = run_blocking(cv2.VideoCapture, session.video_path)
         
         if not cap.isOpened():
-            socketio.emit('error', {'message': 'Could not open video file'}, room=session_id)
+            socketio.emit('error', {'message': 'Could not open video file'}, room=room)
             return
         
         # Get video properties
@@ -264,59 +720,88 @@ def process_video_realtime(video_path, session_id):
         tracker = CentroidTracker(max_disappeared=3)
         vehicle_type_counts = {v: 0 for v in VEHICLE_CLASSES.values()}
         frame_count = 0
+        frames_since_detection = 0
+        dropped_frames = 0
+        total_vehicles = 0
+        tracked = []
+        renderer = TierRenderer(jpeg_quality=70)
         start_time = time.time()
         
-        socketio.emit('start', {
-            'total_frames': total_frames,
-            'fps': fps,
-            'width': frame_width,
-            'height': frame_height
-        }, room=session_id)
+        with video_sessions_lock:
+            session.start_info = {
+                'total_frames': total_frames,
+                'fps': fps,
+                'width': frame_width,
+                'height': frame_height,
+                'tiers': list(OUTPUT_TIERS)
+            }
+            socketio.emit('start', session.start_info, room=room)
         
         # Cache previous detections for smooth playback
         previous_detections = []
         
-        while True:
+        while not session.stopped:
+            # Yield so control events (stop/pause/disconnect) are handled
+            # even while the pipeline is behind schedule
+            socketio.sleep(0)
+            
+            # Block while paused and shift the clock so playback resumes in place
+            if not session.resume_event.is_set():
+                pause_started = time.time()
+                session.resume_event.wait()
+                start_time += time.time() - pause_started
+                if session.stopped:
+                    break
+            
             # Calculate expected time for this frame
             expected_time = start_time + (frame_count * frame_delay)
             current_time = time.time()
             
-            # Wait if we're ahead of schedule
+            # Wait if we're ahead of schedule (wakes early on stop)
             if current_time < expected_time:
-                time.sleep(expected_time - current_time)
+                if session.stop_event.wait(expected_time - current_time):
+                    break
+            elif session.realtime_clock:
+                # Behind schedule: skip straight to the frame due now.
+                # grab() still decodes, but avoids retrieve() and everything after it
+                frames_behind = int((current_time - start_time) / frame_delay) - frame_count
+                skipped = run_blocking(grab_frames, cap, frames_behind) if frames_behind > 0 else 0
+                frame_count += skipped
+                dropped_frames += skipped
+                if skipped < frames_behind:
+                    break  # Reached the end of the video while skipping
+                expected_time = start_time + (frame_count * frame_delay)
             
-            ret, frame = cap.read()
+            ret, frame = run_blocking(cap.read)
             if not ret:
                 break
             
+            # How far behind the video clock this frame is being decoded
+            drift_ms = max(0.0, (time.time() - expected_time) * 1000)
+            
             frame_count += 1
+            session.frame_number = frame_count
+            frames_since_detection += 1
             frame_vehicles = []
             
-            # Run YOLO detection every 3 frames for speed + use cached results
-            if frame_count % 3 == 0:
+            # Run YOLO detection every few decoded frames + use cached results
+            if frames_since_detection >= DETECTION_INTERVAL:
+                frames_since_detection = 0
                 # Fast settings: smaller image size, lower confidence
-                results = model(frame, conf=0.3, imgsz=640, verbose=False)[0]
+                detections = run_inference(frame, conf=0.3, imgsz=640, roi=session.roi)
                 
                 # Collect detections
-                rects = []
-                vehicle_types = []
-                
-                for box in results.boxes:
-                    cls_id = int(box.cls[0])
-                    
-                    if cls_id in VEHICLE_CLASSES:
-                        x1, y1, x2, y2 = box.xyxy[0].cpu().numpy().astype(int)
-                        rects.append((x1, y1, x2, y2))
-                        vehicle_types.append(VEHICLE_CLASSES[cls_id])
+                rects = [rect for rect, _, _ in detections]
+                vehicle_types = [vehicle_type for _, vehicle_type, _ in detections]
                 
                 # Update tracker
                 tracked = tracker.update(rects, vehicle_types)
-                previous_detections = list(zip(rects, vehicle_types))
+                previous_detections = detections
             else:
                 # Use cached detections for skipped frames
-                rects, vehicle_types = zip(*previous_detections) if previous_detections else ([], [])
-                rects = list(rects)
-                vehicle_types = list(vehicle_types)
+                detections = previous_detections
+                rects = [rect for rect, _, _ in detections]
+                vehicle_types = [vehicle_type for _, vehicle_type, _ in detections]
             
             # Total vehicles in this frame = number of detections
             total_vehicles = len(rects)
@@ -333,51 +818,49 @@ def process_video_realtime(video_path, session_id):
             if frame_count % 30 == 0:
                 print(f"Frame {frame_count}/{total_frames}: {current_frame_count} vehicles visible, Total ever: {total_vehicles}")
                 print(f"Tracked vehicles: {len(tracked)} with IDs: {[t[0] for t in tracked]}")
+                print(f"Drift: {drift_ms:.0f}ms, dropped frames: {dropped_frames}")
             
-            # Draw detections (only vehicle type, no number plate text)
-            for i, (x1, y1, x2, y2) in enumerate(rects):
-                color = (0, 255, 0)
-                cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
-                label = f"{vehicle_types[i]}"
-                cv2.putText(frame, label, (x1, y1 - 10),
-                          cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
-                
+            # Vehicle boxes are reported in source-frame coordinates
+            for (x1, y1, x2, y2), vehicle_type, confidence in detections:
                 frame_vehicles.append({
-                    'type': vehicle_types[i],
+                    'type': vehicle_type,
                     'bbox': [int(x1), int(y1), int(x2), int(y2)],
-                    'confidence': 0.0
+                    'confidence': round(confidence, 3)
                 })
             
-            # Draw total count
-            cv2.putText(frame, f"Total Vehicles: {total_vehicles}", (10, 30),
-                       cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 255), 2)
-            
-            # Encode and emit with optimized compression
+            # Draw detections (only vehicle type, no number plate text) and
+            # encode once per tier, then broadcast to that tier's viewers
             # Use lower quality JPEG for faster transmission
-            success, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 70])
+            encoded = run_blocking(renderer.render, frame, session.active_tiers(), rects, vehicle_types,
+                                   f"Total Vehicles: {total_vehicles}")
             
-            if success:
-                frame_base64 = base64.b64encode(buffer).decode('utf-8')
-                
+            for tier, (frame_base64, width, height) in encoded.items():
                 socketio.emit('frame', {
                     'frame': frame_base64,
+                    'tier': tier,
+                    'width': width,
+                    'height': height,
                     'frame_number': frame_count,
                     'total_frames': total_frames,
                     'vehicles': frame_vehicles,
                     'total_vehicles': total_vehicles,
-                    'vehicle_types': vehicle_type_counts
-                }, room=session_id)
-                
-                if frame_count % 50 == 0:
-                    print(f"Sent frame {frame_count}/{total_frames}")
-            else:
-                print(f"Failed to encode frame {frame_count}")
+                    'vehicle_types': vehicle_type_counts,
+                    'drift_ms': round(drift_ms, 1),
+                    'dropped_frames': dropped_frames
+                }, room=session.tier_room(tier))
+            
+            if frame_count % 50 == 0:
+                print(f"Sent frame {frame_count}/{total_frames} in tiers: {', '.join(encoded)}")
         
-        cap.release()
+        if session.stopped:
+            print(f"Session {room} cancelled at frame {frame_count}/{total_frames}")
+            socketio.emit('stopped', session.stopped_info(), room=room)
+            return
         
         socketio.emit('complete', {
             'total_vehicles': total_vehicles,
             'vehicle_types': vehicle_type_counts,
+            'dropped_frames': dropped_frames,
             'video_info': {
                 'fps': fps,
                 'width': frame_width,
@@ -385,15 +868,22 @@ def process_video_realtime(video_path, session_id):
                 'total_frames': total_frames,
                 'duration_seconds': total_frames / fps
             }
-        }, room=session_id)
+        }, room=room)
         
     except Exception as e:
         print(f"Error in real-time processing: {str(e)}")
-        socketio.emit('error', {'message': str(e)}, room=session_id)
+        socketio.emit('error', {'message': str(e)}, room=room)
+    finally:
+        if cap is not None:
+            cap.release()
+        with video_sessions_lock:
+            if video_sessions.get(session.video_path) is session:
+                del video_sessions[session.video_path]
 
-def process_video(video_path, num_lanes=4):
+def process_video(video_path, num_lanes=4, roi=None):
     """
     Process video and detect vehicles with lane-wise counting
+    roi: optional RegionOfInterest to restrict detection to
     """
     cap = cv2.VideoCapture(video_path)
     
@@ -434,7 +924,7 @@ def process_video(video_path, num_lanes=4):
         frame_count += 1
         
         # Process every frame for smooth, normal-speed playback
-        results = model(frame, conf=0.4, verbose=False)[0]
+        detections = run_inference(frame, conf=0.4, imgsz=640, roi=roi)
         
         frame_vehicles = []
         
@@ -444,40 +934,32 @@ def process_video(video_path, num_lanes=4):
             cv2.line(frame, (x, 0), (x, frame_height), (255, 255, 0), 2)
         
         # Process detections
-        for box in results.boxes:
-            cls_id = int(box.cls[0])
-            
-            # Check if it's a vehicle
-            if cls_id in VEHICLE_CLASSES:
-                # Get bounding box
-                x1, y1, x2, y2 = box.xyxy[0].cpu().numpy().astype(int)
-                conf = float(box.conf[0])
-                
-                # Calculate center point
-                center_x = (x1 + x2) // 2
-                center_y = (y1 + y2) // 2
-                
-                # Determine lane
-                lane_num = get_vehicle_lane(center_x, lanes)
-                lane_key = f"L{lane_num}"
-                
-                # Create unique vehicle ID based on position
-                vehicle_id = f"{center_x//50}_{center_y//50}_{cls_id}"
-                
-                if vehicle_id not in tracked_vehicles:
-                    tracked_vehicles.add(vehicle_id)
-                    lane_counts[lane_key] += 1
-                    vehicle_type_counts[VEHICLE_CLASSES[cls_id]] += 1
-                    total_vehicles += 1
-                
-                # Draw bounding box
-                color = (0, 255, 0)  # Green
-                cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
-                
-                # Draw label
-                label = f"{VEHICLE_CLASSES[cls_id]} {lane_key}"
-                cv2.putText(frame, label, (x1, y1 - 10),
-                          cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+        for (x1, y1, x2, y2), vehicle_type, conf in detections:
+            # Calculate center point
+            center_x = (x1 + x2) // 2
+            center_y = (y1 + y2) // 2
+            
+            # Determine lane
+            lane_num = get_vehicle_lane(center_x, lanes)
+            lane_key = f"L{lane_num}"
+            
+            # Create unique vehicle ID based on position
+            vehicle_id = f"{center_x//50}_{center_y//50}_{vehicle_type}"
+            
+            if vehicle_id not in tracked_vehicles:
+                tracked_vehicles.add(vehicle_id)
+                lane_counts[lane_key] += 1
+                vehicle_type_counts[vehicle_type] += 1
+                total_vehicles += 1
+            
+            # Draw bounding box
+            color = (0, 255, 0)  # Green
+            cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+            
+            # Draw label
+            label = f"{vehicle_type} {lane_key}"
+            cv2.putText(frame, label, (x1, y1 - 10),
+                      cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
         
         # Draw lane labels at top
         for i in range(num_lanes):
@@ -520,6 +1002,370 @@ def process_video(video_path, num_lanes=4):
     
     return results
 
+class StreamSource(Broadcast):
+    """
+    Video source the server pulls itself: a stream URL or a looping local file
+    A capture background task keeps only the latest frame, sampled at the
+    source's target fps; the shared SourceScheduler runs detection on it
+    Each source keeps its own tracker and vehicle counts
+    """
+    def __init__(self, source_id, url, is_file=False, name=None, fps=SOURCE_DEFAULT_FPS,
+                 priority=1.0, loop=True, roi=None):
+        if not math.isfinite(fps) or fps <= 0:
+            raise ValueError("fps must be a positive number")
+        if not math.isfinite(priority) or priority <= 0:
+            raise ValueError("priority must be a positive number")
+        super().__init__(f"source_{source_id}", threading.Lock())
+        self.source_id = source_id
+        self.url = url
+        # Never expose stream credentials or server paths to clients
+        self.display_url = os.path.basename(url) if is_file else redact_url(url)
+        self.name = name or source_id
+        self.fps = fps
+        self.priority = priority
+        self.is_file = is_file
+        self.loop = loop
+        self.roi = roi
+        
+        self.tracker = CentroidTracker(max_disappeared=3, max_distance=SOURCE_TRACK_DISTANCE)
+        self.vehicle_type_counts = {v: 0 for v in VEHICLE_CLASSES.values()}
+        self.total_vehicles = 0
+        self.renderer = TierRenderer(jpeg_quality=70)
+        
+        # Scheduler state, guarded by the scheduler's condition
+        self.pending_frame = None
+        self.pass_value = 0.0
+        
+        self.status = 'starting'
+        self.processed_frames = 0
+        self.dropped_frames = 0  # Frames replaced before the scheduler got to them
+        self.measured_fps = 0.0
+        self.last_processed = None
+        self.stop_event = threading.Event()
+        self.thread = None
+    
+    def start(self):
+        self.thread = socketio.start_background_task(self._capture_loop)
+    
+    def stop(self):
+        self.stop_event.set()
+    
+    def _capture_loop(self):
+        """
+        Keep the capture drained with grab() and only decode frames at the
+        target fps; local files are read at their own frame rate and looped
+        """
+        frame_interval = 1.0 / self.fps
+        
+        while not self.stop_event.is_set():
+            cap = run_blocking(cv2.VideoCapture, self.url)
+            if not cap.isOpened():
+                cap.release()
+                self.status = 'unavailable'
+                print(f"Source {self.source_id}: could not open {self.display_url}, retrying")
+                self.stop_event.wait(SOURCE_RECONNECT_DELAY)
+                continue
+            
+            self.status = 'running'
+            file_fps = cap.get(cv2.CAP_PROP_FPS) if self.is_file else 0
+            grab_delay = 1.0 / file_fps if file_fps > 0 else 0.033
+            next_grab = time.time()
+            last_retrieve = 0.0
+            
+            while not self.stop_event.is_set():
+                # Yield so other sources, the scheduler and Socket.IO handlers run
+                socketio.sleep(0)
+                
+                if self.is_file:
+                    # Files decode faster than real time: pace them like a live feed
+                    delay = next_grab - time.time()
+                    if delay > 0 and self.stop_event.wait(delay):
+                        break
+                    next_grab = max(next_grab + grab_delay, time.time() - grab_delay)
+                
+                if not run_blocking(cap.grab):
+                    if self.is_file and self.loop and cap.set(cv2.CAP_PROP_POS_FRAMES, 0):
+                        continue
+                    break
+                
+                now = time.time()
+                if now - last_retrieve < frame_interval:
+                    continue
+                
+                ret, frame = run_blocking(cap.retrieve)
+                if ret:
+                    last_retrieve = now
+                    source_scheduler.submit(self, frame)
+            
+            cap.release()
+            
+            if self.is_file and not self.loop:
+                # Free the slot; dashboards are told the feed has ended
+                self.status = 'finished'
+                source_scheduler.discard(self)
+                socketio.emit('source_finished', self.info(), room=self.room)
+                return
+            if not self.stop_event.is_set():
+                self.status = 'reconnecting'
+                self.stop_event.wait(SOURCE_RECONNECT_DELAY)
+        
+        self.status = 'stopped'
+    
+    def process(self, frame):
+        """Detect, track and count vehicles, then broadcast to subscribers"""
+        now = time.time()
+        interval = None
+        if self.last_processed is not None:
+            interval = max(now - self.last_processed, 1e-6)
+            if self.measured_fps == 0:
+                self.measured_fps = 1.0 / interval
+            else:
+                self.measured_fps = 0.9 * self.measured_fps + 0.1 / interval
+        self.last_processed = now
+        self.processed_frames += 1
+        
+        detections = run_inference(frame, conf=0.3, imgsz=640, roi=self.roi)
+        rects = [rect for rect, _, _ in detections]
+        vehicle_types = [vehicle_type for _, vehicle_type, _ in detections]
+        
+        # Vehicles move further between frames when the scheduler serves this
+        # source below its target fps, so widen the match distance to match;
+        # otherwise the same vehicle is registered (and counted) again
+        if interval is not None:
+            scale = min(SOURCE_MAX_TRACK_SCALE, max(1.0, interval * self.fps))
+            self.tracker.max_distance = SOURCE_TRACK_DISTANCE * scale
+        
+        # Every newly registered object is a vehicle we have not counted yet
+        first_new_id = self.tracker.next_object_id
+        self.tracker.update(rects, vehicle_types)
+        for object_id in range(first_new_id, self.tracker.next_object_id):
+            vehicle_type = self.tracker.object_types.get(object_id)
+            if vehicle_type is not None:
+                self.vehicle_type_counts[vehicle_type] += 1
+                self.total_vehicles += 1
+        
+        # Nobody watching: keep counting but skip drawing and encoding
+        tiers = self.active_tiers()
+        if not tiers:
+            return
+        
+        frame_vehicles = [{
+            'type': vehicle_type,
+            'bbox': [int(x1), int(y1), int(x2), int(y2)],
+            'confidence': round(confidence, 3)
+        } for (x1, y1, x2, y2), vehicle_type, confidence in detections]
+        
+        encoded = run_blocking(self.renderer.render, frame, tiers, rects, vehicle_types,
+                               f"{self.name}: {len(rects)} vehicles")
+        
+        for tier, (frame_base64, width, height) in encoded.items():
+            socketio.emit('source_frame', {
+                'source_id': self.source_id,
+                'frame': frame_base64,
+                'tier': tier,
+                'width': width,
+                'height': height,
+                'vehicles': frame_vehicles,
+                'current_vehicles': len(rects),
+                'total_vehicles': self.total_vehicles,
+                'vehicle_types': self.vehicle_type_counts,
+                'fps': round(self.measured_fps, 1),
+                'timestamp': now
+            }, room=self.tier_room(tier))
+    
+    def info(self):
+        return {
+            'id': self.source_id,
+            'name': self.name,
+            'url': self.display_url,
+            'status': self.status,
+            'fps': self.fps,
+            'measured_fps': round(self.measured_fps, 1),
+            'priority': self.priority,
+            'loop': self.loop,
+            'viewers': len(self.viewers),
+            'processed_frames': self.processed_frames,
+            'dropped_frames': self.dropped_frames,
+            'total_vehicles': self.total_vehicles,
+            'vehicle_types': self.vehicle_type_counts
+        }
+
+class SourceScheduler:
+    """
+    Shares the single YOLO model across all registered stream sources
+    Uses stride scheduling: serving a source advances its pass value by
+    1/priority and the ready source with the lowest pass goes next, so
+    under load each source gets inference in proportion to its priority
+    and no source starves
+    """
+    def __init__(self):
+        self.sources = {}
+        self.condition = threading.Condition()
+        self.thread = None
+        self.current_pass = 0.0  # Pass value of the last source served
+    
+    def add(self, source):
+        with self.condition:
+            if source.source_id in self.sources:
+                raise ValueError(f"Source '{source.source_id}' is already registered")
+            if len(self.sources) >= MAX_STREAM_SOURCES:
+                raise ValueError(f"Source limit reached ({MAX_STREAM_SOURCES})")
+            
+            # Start level with the others so a new source neither starves
+            # them nor waits behind their accumulated pass values
+            if self.sources:
+                source.pass_value = min(s.pass_value for s in self.sources.values())
+            self.sources[source.source_id] = source
+            
+            if self.thread is None:
+                self.thread = socketio.start_background_task(self._run)
+        
+        source.start()
+    
+    def remove(self, source_id):
+        with self.condition:
+            source = self.sources.pop(source_id, None)
+        if source is not None:
+            source.stop()
+        return source
+    
+    def discard(self, source):
+        """Unregister a source that has ended by itself"""
+        with self.condition:
+            if self.sources.get(source.source_id) is source:
+                del self.sources[source.source_id]
+    
+    def get(self, source_id):
+        with self.condition:
+            return self.sources.get(source_id)
+    
+    def all(self):
+        with self.condition:
+            return list(self.sources.values())
+    
+    def submit(self, source, frame):
+        """Hand the latest frame of a source to the scheduler"""
+        with self.condition:
+            if source.pending_frame is not None:
+                source.dropped_frames += 1
+            else:
+                # A source that sat idle (e.g. reconnecting) must not bank
+                # credit and then monopolise the model when it returns
+                source.pass_value = max(source.pass_value, self.current_pass)
+            source.pending_frame = frame
+            self.condition.notify()
+    
+    def _next_source(self):
+        ready = [s for s in self.sources.values() if s.pending_frame is not None]
+        if not ready:
+            return None
+        return min(ready, key=lambda s: s.pass_value)
+    
+    def _run(self):
+        while True:
+            with self.condition:
+                source = self._next_source()
+                while source is None:
+                    self.condition.wait()
+                    source = self._next_source()
+                frame = source.pending_frame
+                source.pending_frame = None
+                self.current_pass = source.pass_value
+                source.pass_value += 1.0 / source.priority
+            
+            try:
+                source.process(frame)
+            except Exception as e:
+                print(f"Error processing source {source.source_id}: {str(e)}")
+            
+            # Yield even when some source always has a frame ready
+            socketio.sleep(0)
+
+source_scheduler = SourceScheduler()
+
+def redact_url(url):
+    """Strip user:password@ from a URL"""
+    parts = urlsplit(url)
+    if '@' not in parts.netloc:
+        return url
+    return urlunsplit(parts._replace(netloc=parts.netloc.rsplit('@', 1)[1]))
+
+def resolve_source_url(url, trusted=False):
+    """
+    Check a source URL and get the path or URL to open
+    Network sources must use an allowed scheme and, unless trusted (from
+    SOURCES_CONFIG), a host in SOURCE_ALLOWED_HOSTS; anything else must be
+    the name of a file in SOURCE_FILES_FOLDER
+    Returns: (capture_url, is_file)
+    """
+    if not isinstance(url, str) or not url:
+        raise ValueError("Source 'url' is required")
+    
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    if scheme:
+        if scheme not in ALLOWED_SOURCE_SCHEMES:
+            raise ValueError(f"Unsupported source scheme '{scheme}'. Allowed: {', '.join(sorted(ALLOWED_SOURCE_SCHEMES))}")
+        if not trusted and (parts.hostname or '').lower() not in SOURCE_ALLOWED_HOSTS:
+            raise ValueError(f"Source host '{parts.hostname}' is not in SOURCE_ALLOWED_HOSTS")
+        return url, False
+    
+    filename = secure_filename(url)
+    if filename != url:
+        raise ValueError("Local sources must be a plain file name in the source files folder")
+    path = os.path.join(SOURCE_FILES_FOLDER, filename)
+    if not os.path.isfile(path):
+        raise ValueError(f"Source file '{filename}' not found")
+    return path, True
+
+def create_source(config, trusted=False):
+    """
+    Build a StreamSource from a registration payload
+    trusted: payload comes from SOURCES_CONFIG, so any host is allowed
+    Raises ValueError for missing or invalid fields
+    """
+    if not isinstance(config, dict):
+        raise ValueError("Source must be a JSON object")
+    
+    source_id = secure_filename(str(config.get('id', '')))
+    if not source_id:
+        raise ValueError("Source 'id' is required")
+    url, is_file = resolve_source_url(config.get('url'), trusted=trusted)
+    
+    return StreamSource(
+        source_id,
+        url,
+        is_file=is_file,
+        name=config.get('name'),
+        fps=float(config.get('fps', SOURCE_DEFAULT_FPS)),
+        priority=float(config.get('priority', 1.0)),
+        loop=parse_bool(config.get('loop'), True),
+        roi=parse_roi(config.get('roi'))
+    )
+
+def load_sources_config(path):
+    """Register the sources listed in a JSON config file"""
+    import json
+    
+    try:
+        with open(path) as f:
+            configs = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Could not load sources config {path}: {str(e)}")
+        return
+    
+    if not isinstance(configs, list):
+        print(f"Sources config {path} must be a JSON list")
+        return
+    
+    for config in configs:
+        source_id = config.get('id') if isinstance(config, dict) else None
+        try:
+            source_scheduler.add(create_source(config, trusted=True))
+            print(f"Registered source: {source_id}")
+        except (ValueError, TypeError) as e:
+            print(f"Skipping source {source_id}: {str(e)}")
+
 @socketio.on('connect')
 def handle_connect():
     print(f"Client connected: {request.sid}")
@@ -528,10 +1374,38 @@ def handle_connect():
 @socketio.on('disconnect')
 def handle_disconnect():
     print(f"Client disconnected: {request.sid}")
+    with video_sessions_lock:
+        for session in find_viewer_sessions(request.sid):
+            session.remove_viewer(request.sid)
+    camera_rois.pop(request.sid, None)
+    for source in source_scheduler.all():
+        with source.viewers_lock:
+            source.remove_viewer(request.sid)
 
 # Frame counter for skipping
 camera_frame_counter = 0
 
+# Region of interest per live camera client
+camera_rois = {}
+
+@socketio.on('set_roi')
+def handle_set_roi(data=None):
+    """
+    Set (or clear with an empty payload) the live camera region of interest
+    """
+    session_id = request.sid
+    try:
+        roi = parse_roi((data or {}).get('roi'))
+    except (ValueError, TypeError) as e:
+        emit('error', {'message': f'Invalid region of interest: {str(e)}'}, room=session_id)
+        return
+    
+    if roi is None:
+        camera_rois.pop(session_id, None)
+    else:
+        camera_rois[session_id] = roi
+    emit('roi_updated', {'roi': (data or {}).get('roi')}, room=session_id)
+
 @socketio.on('camera_frame')
 def handle_camera_frame(data):
     """
@@ -567,44 +1441,42 @@ def handle_camera_frame(data):
         frame_height, frame_width = frame.shape[:2]
         is_mobile = frame_width < 400  # Mobile sends smaller frames
         
+        roi = camera_rois.get(session_id)
+        
         # Dynamic YOLO settings: PC gets better quality, Mobile gets speed
         if is_mobile:
             # Mobile: Ultra-fast for real-time
-            results = model(frame, conf=0.4, imgsz=320, verbose=False)[0]
+            detections = run_inference(frame, conf=0.4, imgsz=320, roi=roi)
             # Skip every other frame on mobile
             if camera_frame_counter % 2 != 0:
                 return
         else:
             # PC Webcam: Better quality, still fast
-            results = model(frame, conf=0.3, imgsz=640, verbose=False)[0]
+            detections = run_inference(frame, conf=0.3, imgsz=640, roi=roi)
         
         # Collect detections
         rects = []
         vehicle_types = []
         frame_vehicles = []
         
-        for box in results.boxes:
-            cls_id = int(box.cls[0])
+        for (x1, y1, x2, y2), vehicle_type, confidence in detections:
+            rects.append((x1, y1, x2, y2))
+            vehicle_types.append(vehicle_type)
             
-            if cls_id in VEHICLE_CLASSES:
-                x1, y1, x2, y2 = box.xyxy[0].cpu().numpy().astype(int)
-                rects.append((x1, y1, x2, y2))
-                vehicle_types.append(VEHICLE_CLASSES[cls_id])
-                
-                # Draw bounding box
-                color = (0, 255, 0)
-                cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
-                
-                # Draw label
-                label = f"{VEHICLE_CLASSES[cls_id]}"
-                cv2.putText(frame, label, (x1, y1 - 10),
-                          cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
-                
-                frame_vehicles.append({
-                    'type': VEHICLE_CLASSES[cls_id],
-                    'bbox': [int(x1), int(y1), int(x2), int(y2)],
-                    'confidence': 0.0
-                })
+            # Draw bounding box
+            color = (0, 255, 0)
+            cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+            
+            # Draw label
+            label = f"{vehicle_type}"
+            cv2.putText(frame, label, (x1, y1 - 10),
+                      cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+            
+            frame_vehicles.append({
+                'type': vehicle_type,
+                'bbox': [int(x1), int(y1), int(x2), int(y2)],
+                'confidence': round(confidence, 3)
+            })
         
         # Draw total count
         total_vehicles = len(rects)
@@ -641,8 +1513,14 @@ def handle_start_camera_stream():
 def handle_process_video(data):
     """
     Handle real-time video processing request
+    Viewers of a video that is already being processed join the existing
+    session instead of starting a second pipeline
     """
-    video_filename = data.get('filename')
+    try:
+        video_filename = parse_filename(data, required=True)
+    except ValueError as e:
+        emit('error', {'message': str(e)})
+        return
     session_id = request.sid
     
     video_path = os.path.join(UPLOAD_FOLDER, video_filename)
@@ -651,13 +1529,185 @@ def handle_process_video(data):
         emit('error', {'message': 'Video file not found'})
         return
     
-    # Process video in a separate thread
-    thread = threading.Thread(
-        target=process_video_realtime,
-        args=(video_path, session_id)
-    )
-    thread.daemon = True
-    thread.start()
+    try:
+        tier = parse_tier(data.get('tier'))
+        realtime = parse_bool(data.get('realtime'), True)
+    except ValueError as e:
+        emit('error', {'message': str(e)})
+        return
+    
+    with video_sessions_lock:
+        session = video_sessions.get(video_path)
+        if session is not None and not session.stopped:
+            # The pipeline is shared, so a joiner cannot change how it runs
+            conflicts = []
+            if data.get('realtime') is not None and realtime != session.realtime_clock:
+                conflicts.append('realtime')
+            if data.get('roi') is not None and data.get('roi') != session.roi_config:
+                conflicts.append('roi')
+            if conflicts:
+                emit('error', {
+                    'message': f"This video is already being processed with different settings: {', '.join(conflicts)}",
+                    'code': 'session_settings_conflict',
+                    'realtime': session.realtime_clock,
+                    'roi': session.roi_config
+                })
+                return
+            
+            session.add_viewer(session_id, tier)
+            emit('session_joined', {
+                'filename': session.filename,
+                'viewers': len(session.viewers),
+                'realtime': session.realtime_clock,
+                'roi': session.roi_config
+            })
+            print(f"Client {session_id} joined session {session.room} ({len(session.viewers)} viewers)")
+            return
+        
+        try:
+            roi = parse_roi(data.get('roi'))
+        except (ValueError, TypeError) as e:
+            emit('error', {'message': f'Invalid region of interest: {str(e)}'})
+            return
+        
+        if len(video_sessions) >= MAX_VIDEO_SESSIONS:
+            emit('error', {
+                'message': f'Server busy: {MAX_VIDEO_SESSIONS} videos are already being processed. Please try again later.',
+                'code': 'server_busy'
+            })
+            return
+        
+        session = VideoSession(video_path, realtime_clock=realtime, roi=roi, roi_config=data.get('roi'))
+        session.add_viewer(session_id, tier)
+        video_sessions[video_path] = session
+        
+        # Process video in a background task (green thread under eventlet)
+        session.thread = socketio.start_background_task(process_video_realtime, session)
+
+@socketio.on('stop_video')
+def handle_stop_video(data=None):
+    """
+    Stop watching a video; the pipeline is cancelled once it has no viewers
+    """
+    session_id = request.sid
+    try:
+        filename = parse_filename(data)
+    except ValueError as e:
+        emit('error', {'message': str(e)})
+        return
+    
+    with video_sessions_lock:
+        sessions = find_viewer_sessions(session_id, filename)
+        for session in sessions:
+            session.remove_viewer(session_id)
+            emit('stopped', session.stopped_info())
+    
+    if not sessions:
+        emit('error', {'message': 'Not watching this video'})
+
+@socketio.on('set_quality')
+def handle_set_quality(data=None):
+    """
+    Switch the output tier (e.g. 360p/720p/source) this client receives
+    Applies to the given 'filename' or 'source_id', or to every video and
+    stream source the client is watching when neither is given
+    """
+    data = data or {}
+    try:
+        filename = parse_filename(data)
+        tier = parse_tier(data.get('tier'))
+    except ValueError as e:
+        emit('error', {'message': str(e)})
+        return
+    source_id = data.get('source_id')
+    
+    sessions = []
+    if source_id is None:
+        with video_sessions_lock:
+            sessions = find_viewer_sessions(request.sid, filename)
+            for session in sessions:
+                session.set_viewer_tier(request.sid, tier)
+    
+    sources = []
+    if filename is None:
+        sources = [source for source in source_scheduler.all()
+                   if (source_id is None or source.source_id == source_id) and request.sid in source.viewers]
+        for source in sources:
+            with source.viewers_lock:
+                source.set_viewer_tier(request.sid, tier)
+    
+    if not sessions and not sources:
+        emit('error', {'message': 'Not watching this video or source'})
+        return
+    
+    emit('quality_updated', {'tier': tier, 'filename': filename, 'source_id': source_id})
+
+@socketio.on('pause_video')
+def handle_pause_video(data=None):
+    """
+    Pause the video(s) this client is watching
+    Other viewers keep receiving frames; the shared pipeline only pauses
+    once all of its viewers have paused
+    """
+    try:
+        filename = parse_filename(data)
+    except ValueError as e:
+        emit('error', {'message': str(e)})
+        return
+    
+    with video_sessions_lock:
+        for session in find_viewer_sessions(request.sid, filename):
+            pipeline_paused = session.pause(request.sid)
+            emit('paused', {'filename': session.filename, 'pipeline_paused': pipeline_paused})
+
+@socketio.on('resume_video')
+def handle_resume_video(data=None):
+    """
+    Resume the paused video(s) this client is watching
+    """
+    try:
+        filename = parse_filename(data)
+    except ValueError as e:
+        emit('error', {'message': str(e)})
+        return
+    
+    with video_sessions_lock:
+        for session in find_viewer_sessions(request.sid, filename):
+            pipeline_paused = session.resume(request.sid)
+            emit('resumed', {'filename': session.filename, 'pipeline_paused': pipeline_paused})
+
+@socketio.on('subscribe_source')
+def handle_subscribe_source(data=None):
+    """
+    Watch a server-side stream source at the chosen output tier
+    """
+    data = data or {}
+    source = source_scheduler.get(data.get('source_id'))
+    if source is None:
+        emit('error', {'message': 'Source not found'})
+        return
+    
+    try:
+        tier = parse_tier(data.get('tier'))
+    except ValueError as e:
+        emit('error', {'message': str(e)})
+        return
+    
+    with source.viewers_lock:
+        source.add_viewer(request.sid, tier)
+    emit('source_subscribed', {'tier': tier, 'source': source.info()})
+
+@socketio.on('unsubscribe_source')
+def handle_unsubscribe_source(data=None):
+    """
+    Stop watching a server-side stream source
+    """
+    source_id = (data or {}).get('source_id')
+    source = source_scheduler.get(source_id)
+    if source is not None:
+        with source.viewers_lock:
+            source.remove_viewer(request.sid)
+    emit('source_unsubscribed', {'source_id': source_id})
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
@@ -725,6 +1775,36 @@ def get_video(filename):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/sources', methods=['GET'])
+def list_sources():
+    """
+    List registered stream sources with their status and counts
+    """
+    return jsonify({'sources': [source.info() for source in source_scheduler.all()]})
+
+@app.route('/api/sources', methods=['POST'])
+def register_source():
+    """
+    Register a stream URL or local file for server-side processing
+    """
+    try:
+        source = create_source(request.get_json(silent=True) or {})
+        source_scheduler.add(source)
+        print(f"Registered source: {source.source_id} ({source.display_url})")
+        return jsonify({'success': True, 'source': source.info()}), 201
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/sources/<source_id>', methods=['DELETE'])
+def remove_source(source_id):
+    """
+    Stop processing a stream source
+    """
+    source = source_scheduler.remove(source_id)
+    if source is None:
+        return jsonify({'error': 'Source not found'}), 404
+    return jsonify({'success': True, 'source': source.info()})
+
 @app.route('/api/results', methods=['GET'])
 def get_all_results():
     """
@@ -744,6 +1824,9 @@ def get_all_results():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+if SOURCES_CONFIG:
+    load_sources_config(SOURCES_CONFIG)
+
 if __name__ == '__main__':
     print("=" * 50)
     print("🚦 Traffic Vision API Server")
@@ -782,11 +1865,16 @@ if __name__ == '__main__':
     print("  - POST /api/upload (Upload video)")
     print("  - GET  /api/video/<filename> (Get processed video)")
     print("  - GET  /api/results (List all results)")
+    print("  - GET/POST /api/sources, DELETE /api/sources/<id> (Stream sources)")
     print("  - GET  / (Live camera page)")
     print("WebSocket Events:")
     print("  - connect (Client connects)")
     print("  - process_video (Start real-time processing)")
+    print("  - stop_video / pause_video / resume_video (Control processing)")
+    print("  - set_quality (Choose output tier: 360p/720p/source)")
+    print("  - subscribe_source / unsubscribe_source (Watch a stream source)")
     print("  - camera_frame (Live camera processing)")
+    print("  - set_roi (Live camera region of interest)")
     print("=" * 50)
     
     if secure_mode and not is_production: